@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
 """Module to generate ascii charts.
 
-This module provides a single function `plot` that can be used to generate an
-ascii chart from a series of numbers. The chart can be configured via several
-options to tune the output.
+This module provides a function `plot` that can be used to generate an ascii
+chart from a series of numbers, and `plot_into` that writes the chart to a
+file-like object line by line. The chart can be configured via several options
+to tune the output.
 """
 
 from __future__ import division
+import sys
 from math import ceil, floor, isnan
+from string import Formatter
 
 
 black = "\033[30m"
@@ -31,7 +34,7 @@ reset = "\033[0m"
 
 
 __all__ = [
-    'plot', 'black', 'red',
+    'plot', 'plot_into', 'black', 'red',
     'green', 'yellow', 'blue',
     'magenta', 'cyan', 'lightgray',
     'default', 'darkgray', 'lightred',
@@ -52,6 +55,247 @@ def colored(char, color):
     else:
         return color + char + reset
 
+def _draw(result, tints, ys, symbols, color):
+    """Draw the line of a single data series onto the `result` canvas.
+
+    `ys` holds the series already scaled to canvas rows, with None in place of
+    missing values. The canvas is indexed bottom-up, row 0 is the lowest row.
+    Glyphs are written uncolored, the `color` of each cell is recorded in the
+    matching `tints` canvas instead and applied by `_join` when the row is
+    rendered.
+    """
+    # bind everything the loop reads to locals, so that each step does not
+    # look up the same symbols again
+    left, right, flat, bar = symbols[2], symbols[3], symbols[4], symbols[9]
+
+    # the corner glyphs drawn at y1 and y0 of a step, indexed by whether the
+    # line goes down (y0 > y1)
+    corners = ((symbols[6], symbols[8]), (symbols[5], symbols[7]))
+
+    for x, (y0, y1) in enumerate(zip(ys, ys[1:])):
+
+        # a single test keeps segments between two values, by far the most
+        # common kind, off the missing value paths
+        if y0 is None or y1 is None:
+            if y1 is not None:
+                result[y1][x] = left
+                tints[y1][x] = color
+            elif y0 is not None:
+                result[y0][x] = right
+                tints[y0][x] = color
+            continue
+
+        if y0 == y1:
+            result[y0][x] = flat
+            tints[y0][x] = color
+            continue
+
+        down = y0 > y1
+        corner1, corner0 = corners[down]
+        result[y1][x] = corner1
+        tints[y1][x] = color
+        result[y0][x] = corner0
+        tints[y0][x] = color
+
+        # fill the rows strictly between the two corners
+        low, high = (y1, y0) if down else (y0, y1)
+        for row in result[low + 1:high]:
+            row[x] = bar
+        for row in tints[low + 1:high]:
+            row[x] = color
+
+def _draw_plain(result, ys, symbols):
+    """Draw the line of a single uncolored data series onto `result`.
+
+    This is `_draw` without the tints canvas, used when no colors are set, so
+    that plain charts do not pay for writing and joining colors per cell.
+    """
+    left, right, flat, bar = symbols[2], symbols[3], symbols[4], symbols[9]
+    corners = ((symbols[6], symbols[8]), (symbols[5], symbols[7]))
+
+    for x, (y0, y1) in enumerate(zip(ys, ys[1:])):
+        if y0 is None or y1 is None:
+            if y1 is not None:
+                result[y1][x] = left
+            elif y0 is not None:
+                result[y0][x] = right
+            continue
+
+        if y0 == y1:
+            result[y0][x] = flat
+            continue
+
+        down = y0 > y1
+        result[y1][x], result[y0][x] = corners[down]
+
+        low, high = (y1, y0) if down else (y0, y1)
+        for row in result[low + 1:high]:
+            row[x] = bar
+
+def _join(cells, tints):
+    """Join a canvas row, emitting color escapes only where the color changes."""
+    parts = []
+    current = None
+    for char, color in zip(cells, tints):
+        if color != current:
+            if current:
+                parts.append(reset)
+            if color:
+                parts.append(color)
+            current = color
+        parts.append(char)
+    if current:
+        parts.append(reset)
+    return ''.join(parts)
+
+def _formatter(placeholder):
+    """Return a function that formats a y-axis value with `placeholder`.
+
+    A placeholder with a single positional field, like the default "{:8.2f} ",
+    is parsed once here and rendered with the `format` builtin, instead of
+    having `str.format` parse it again for every label. Anything else falls
+    back to `placeholder.format`.
+    """
+    try:
+        fields = list(Formatter().parse(placeholder))
+    except ValueError:
+        return placeholder.format
+
+    prefix, suffix, spec = '', '', None
+    for literal, name, format_spec, conversion in fields:
+        if spec is None:
+            prefix += literal
+        else:
+            suffix += literal
+        if name is not None:
+            if spec is not None or name not in ('', '0') or conversion or '{' in format_spec:
+                return placeholder.format
+            spec = format_spec
+
+    if spec is None:
+        return placeholder.format
+
+    return lambda value: prefix + format(value, spec) + suffix
+
+# rendered y-axis columns, keyed on everything the labels depend on, so that
+# charts redrawn with the same bounds, as in dashboards, skip the formatting
+_axis_cache = {}
+
+def _axis(maximum, interval, min2, max2, offset, placeholder, zero_tick, tick):
+    """Render the labels and tick marks of the y-axis, bottom-up."""
+    # repr tells apart values that compare equal but format differently, like
+    # 0.0 and -0.0
+    key = (repr(maximum), repr(interval), min2, max2, offset, placeholder, zero_tick, tick)
+    if key in _axis_cache:
+        return _axis_cache[key]
+
+    rows = max2 - min2
+    formatter = _formatter(placeholder)
+    labels = []
+    ticks = []
+
+    # each label is padded into a single string in front of the tick mark,
+    # which takes the last column of the offset and hides a label that would
+    # only start there
+    for y in range(max2, min2 - 1, -1):
+        label = formatter(maximum - ((y - min2) * interval / (rows if rows else 1)))
+        start = max(offset - len(label), 0)
+        if start < offset - 1:
+            labels.append(' ' * start + label + ' ' * (offset - start - 2))
+        else:
+            labels.append(' ' * (offset - 1))
+        ticks.append(zero_tick if y == 0 else tick)  # zero tick mark
+
+    if len(_axis_cache) >= 64:
+        _axis_cache.clear()
+    _axis_cache[key] = result = (tuple(labels), tuple(ticks))
+    return result
+
+def _render(series, cfg):
+    """Generate the lines of the chart, top to bottom, for `plot` and `plot_into`."""
+    if len(series) == 0:
+        return
+
+    if not isinstance(series[0], list):
+        if all(isnan(n) for n in series):
+            return
+        else:
+            series = [series]
+
+    cfg = cfg or {}
+
+    colors = cfg.get('colors', [None])
+
+    minimum = cfg.get('min')
+    maximum = cfg.get('max')
+
+    # scan the data only for the bounds that were not given, and only once
+    if minimum is None or maximum is None:
+        values = [n for s in series for n in s if _isnum(n)]
+        if minimum is None:
+            minimum = min(values)
+        if maximum is None:
+            maximum = max(values)
+
+    default_symbols = ['┼', '┤', '╶', '╴', '─', '╰', '╭', '╮', '╯', '│']
+    symbols = cfg.get('symbols', default_symbols)
+
+    if minimum > maximum:
+        raise ValueError('The min value cannot exceed the max value.')
+
+    interval = maximum - minimum
+    offset = cfg.get('offset', 3)
+    height = cfg.get('height', interval)
+    ratio = height / interval if interval > 0 else 1
+
+    min2 = int(floor(minimum * ratio))
+    max2 = int(ceil(maximum * ratio))
+
+    rows = max2 - min2
+
+    width = 0
+    for i in range(0, len(series)):
+        width = max(width, len(series[i]))
+
+    # the axis column is kept apart from the plot area, so that the canvas
+    # only ever holds single glyphs and labels are prepended once per row
+    axis, ticks = _axis(maximum, interval, min2, max2, offset, cfg.get('format', '{:8.2f} '), symbols[0], symbols[1])
+    ticks = list(ticks)
+
+    # scale every value once rather than once per adjacent segment, clamping
+    # inline instead of through min() and max() calls
+    scaled_series = [
+        [None if isnan(n) else int(round((minimum if n < minimum else maximum if n > maximum else n) * ratio) - min2) for n in s]
+        for s in series
+    ]
+
+    # first value is a tick mark across the y-axis
+    y0 = scaled_series[0][0]
+    if y0 is not None:
+        ticks[y0] = symbols[0]
+
+    # the canvas is indexed bottom-up, so the scaled values address its rows
+    # directly, and it is walked top-down once when the lines are rendered
+    result = [[' '] * width for i in range(rows + 1)]
+
+    # without colors there is nothing to track per cell, so the tints canvas
+    # and the color-aware join are skipped altogether
+    if not any(colors):
+        for ys in scaled_series:
+            _draw_plain(result, ys, symbols)
+        for label, tick, cells in zip(reversed(axis), reversed(ticks), reversed(result)):
+            yield (label + tick + ''.join(cells)).rstrip()
+        return
+
+    tints = [[None] * width for i in range(rows + 1)]
+
+    for i, ys in enumerate(scaled_series):
+        color = colors[i % len(colors)] or None
+        _draw(result, tints, ys, symbols, color)
+
+    for label, tick, cells, tint in zip(reversed(axis), reversed(ticks), reversed(result), reversed(tints)):
+        yield (label + tick + _join(cells, tint)).rstrip()
+
 def plot(series, cfg=None):
     """Generate an ascii chart for a series of numbers.
 
@@ -118,97 +362,31 @@ def plot(series, cfg=None):
               30 ┤ ╭╯  ╰╮
               20 ┤╭╯    ╰╮
               10 ┼╯      ╰
-    """
-    if len(series) == 0:
-        return ''
-
-    if not isinstance(series[0], list):
-        if all(isnan(n) for n in series):
-            return ''
-        else:
-            series = [series]
-
-    cfg = cfg or {}
-
-    colors = cfg.get('colors', [None])
-
-    minimum = cfg.get('min', min(filter(_isnum, [j for i in series for j in i])))
-    maximum = cfg.get('max', max(filter(_isnum, [j for i in series for j in i])))
-
-    default_symbols = ['┼', '┤', '╶', '╴', '─', '╰', '╭', '╮', '╯', '│']
-    symbols = cfg.get('symbols', default_symbols)
-
-    if minimum > maximum:
-        raise ValueError('The min value cannot exceed the max value.')
-
-    interval = maximum - minimum
-    offset = cfg.get('offset', 3)
-    height = cfg.get('height', interval)
-    ratio = height / interval if interval > 0 else 1
-
-    min2 = int(floor(minimum * ratio))
-    max2 = int(ceil(maximum * ratio))
-
-    def clamp(n):
-        return min(max(n, minimum), maximum)
-
-    def scaled(y):
-        return int(round(clamp(y) * ratio) - min2)
-
-    rows = max2 - min2
-
-    width = 0
-    for i in range(0, len(series)):
-        width = max(width, len(series[i]))
-    width += offset
-
-    placeholder = cfg.get('format', '{:8.2f} ')
 
-    result = [[' '] * width for i in range(rows + 1)]
-
-    # axis and labels
-    for y in range(min2, max2 + 1):
-        label = placeholder.format(maximum - ((y - min2) * interval / (rows if rows else 1)))
-        result[y - min2][max(offset - len(label), 0)] = label
-        result[y - min2][offset - 1] = symbols[0] if y == 0 else symbols[1]  # zero tick mark
-
-    # first value is a tick mark across the y-axis
-    d0 = series[0][0]
-    if _isnum(d0):
-        result[rows - scaled(d0)][offset - 1] = symbols[0]
-
-    for i in range(0, len(series)):
-
-        color = colors[i % len(colors)]
+    `colors` specifies a list of ANSI colors, one per series, cycled if there
+    are more series than colors. Adjacent cells of the same color share a
+    single escape sequence:
 
-        # plot the line
-        for x in range(0, len(series[i]) - 1):
-            d0 = series[i][x + 0]
-            d1 = series[i][x + 1]
-
-            if isnan(d0) and isnan(d1):
-                continue
-
-            if isnan(d0) and _isnum(d1):
-                result[rows - scaled(d1)][x + offset] = colored(symbols[2], color)
-                continue
-
-            if _isnum(d0) and isnan(d1):
-                result[rows - scaled(d0)][x + offset] = colored(symbols[3], color)
-                continue
-
-            y0 = scaled(d0)
-            y1 = scaled(d1)
-            if y0 == y1:
-                result[rows - y0][x + offset] = colored(symbols[4], color)
-                continue
+        >>> print(repr(plot([1,2,2,1], {'colors': [blue]})))
+        '    2.00  ┤\\x1b[34m╭─╮\\x1b[0m\\n    1.00  ┼\\x1b[34m╯\\x1b[0m \\x1b[34m╰\\x1b[0m'
+    """
+    return '\n'.join(_render(series, cfg))
 
-            result[rows - y1][x + offset] = colored(symbols[5], color) if y0 > y1 else colored(symbols[6], color)
-            result[rows - y0][x + offset] = colored(symbols[7], color) if y0 > y1 else colored(symbols[8], color)
+def plot_into(series, cfg=None, out=None):
+    """Write an ascii chart for a series of numbers to a file-like object.
 
-            start = min(y0, y1) + 1
-            end = max(y0, y1)
-            for y in range(start, end):
-                result[rows - y][x + offset] = colored(symbols[9], color)
+    Takes the same `series` and `cfg` as `plot`, but writes each line of the
+    chart to `out` as soon as it is rendered, followed by a newline, instead of
+    building the whole chart as one string. `out` defaults to `sys.stdout`:
 
-    return '\n'.join([''.join(row).rstrip() for row in result])
+        >>> plot_into([1,2,3,4,3,2,1])
+            4.00  ┤  ╭╮
+            3.00  ┤ ╭╯╰╮
+            2.00  ┤╭╯  ╰╮
+            1.00  ┼╯    ╰
+    """
+    if out is None:
+        out = sys.stdout
+    for line in _render(series, cfg):
+        out.write(line)
+        out.write('\n')
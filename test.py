@@ -7,7 +7,7 @@ from math import pi
 
 # ------------------------------------------------------------------------------
 
-from asciichartpy import plot
+from asciichartpy import plot, plot_into
 
 # ------------------------------------------------------------------------------
 
@@ -25,3 +25,5 @@ series = [0.0] * width
 
 print(plot(series))
 print(plot(series, {'height':5}))
+
+plot_into(series, {'height':5})